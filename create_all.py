@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Create all library outputs in parallel:
+- handball-library_v14.hblib (create_hblib.py)
+- handball-library_v15_optimized.hblib (create_hblib_optimized.py)
+- library_v15_remote_images.json (create_library_json_only.py)
+
+The library JSON is parsed once. On systems with fork() the worker
+processes inherit the parsed data; elsewhere each worker loads it itself.
+"""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from create_hblib import create_hblib
+from create_hblib_optimized import create_hblib_optimized
+from create_library_json_only import create_library_json_for_app
+from json_utils import load_json
+
+# Paths
+LIBRARY_JSON = 'library_with_full_pages.json'
+IMAGES_DIR = 'drill_images'
+OUTPUT_HBLIB = 'handball-library_v14.hblib'
+OUTPUT_HBLIB_OPTIMIZED = 'handball-library_v15_optimized.hblib'
+OUTPUT_JSON = 'library_v15_remote_images.json'
+
+# Base URL für Bilder (GitHub Raw URL)
+BASE_IMAGE_URL = 'https://raw.githubusercontent.com/dhoenscheid/HandballApp/main/'
+
+# Parsed library, set in the parent before the workers are forked
+library_data = None
+
+def run_builder(name):
+    """Run one builder (in a worker process)."""
+    if name == 'hblib':
+        create_hblib(LIBRARY_JSON, IMAGES_DIR, OUTPUT_HBLIB,
+                     library_data=library_data)
+    elif name == 'hblib_optimized':
+        create_hblib_optimized(LIBRARY_JSON, IMAGES_DIR, OUTPUT_HBLIB_OPTIMIZED,
+                               library_data=library_data)
+    elif name == 'json_only':
+        create_library_json_for_app(LIBRARY_JSON, OUTPUT_JSON, BASE_IMAGE_URL,
+                                    library_data=library_data)
+    else:
+        raise ValueError(f"Unknown builder: {name}")
+    return name
+
+def create_all():
+    """Run all builders in parallel processes."""
+    global library_data
+
+    builders = ['hblib', 'hblib_optimized', 'json_only']
+
+    if 'fork' in multiprocessing.get_all_start_methods():
+        library_data = load_json(LIBRARY_JSON)
+        context = multiprocessing.get_context('fork')
+    else:
+        context = None
+
+    with ProcessPoolExecutor(max_workers=len(builders), mp_context=context) as executor:
+        for name in executor.map(run_builder, builders):
+            print(f"✓ Finished {name}")
+
+if __name__ == '__main__':
+    create_all()
+
+    print("\n✓ Done! All library outputs created.")
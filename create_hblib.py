@@ -7,13 +7,18 @@ Create .hblib package from library JSON and drill images.
 - images/drill_images_v2/ (folder with all drill images)
 """
 
-import json
+import hashlib
 import zipfile
 import os
 from pathlib import Path
 from datetime import datetime
 
-def create_hblib(library_json_path, images_dir, output_hblib_path):
+from hblib_utils import (ARCHIVE_IMAGE_PREFIX, IO_BUFFER_SIZE, SOURCE_IMAGE_PREFIX,
+                         add_image, image_exists, read_images, write_json)
+from json_utils import load_json
+
+def create_hblib(library_json_path, images_dir, output_hblib_path, dedupe_images=False,
+                 columnar_manifest=False, library_data=None):
     """
     Create .hblib package from library JSON and images.
     
@@ -21,24 +26,42 @@ def create_hblib(library_json_path, images_dir, output_hblib_path):
         library_json_path: Path to library_with_full_pages.json
         images_dir: Path to drill_images/ directory
         output_hblib_path: Output path for .hblib file
+        dedupe_images: Store images with identical content only once and
+            record the skipped paths under "aliases" in the manifest
+            (the app must resolve them)
+        columnar_manifest: Write the manifest drills as parallel lists under
+            "drill_columns" instead of one dict per drill (the app must support it)
+        library_data: Already parsed library JSON (skips loading library_json_path)
     """
     print(f"Creating {output_hblib_path}...")
     
     # Load library JSON
-    with open(library_json_path, 'r', encoding='utf-8') as f:
-        library_data = json.load(f)
+    if library_data is None:
+        library_data = load_json(library_json_path)
     
     # Create image manifest
     manifest = {
         "version": "v2",
         "root": "drill_images_v2",
         "type": "full_page_screenshots",
-        "created_at": datetime.now().isoformat(),
-        "drills": {}
+        "created_at": datetime.now().isoformat()
     }
     
-    # Collect all drill images (use set to avoid duplicates)
-    image_files_set = set()
+    # Collect all drill images (keyed by source path to avoid duplicates)
+    image_files_map = {}
+    dir_cache = {}
+    if columnar_manifest:
+        # Drill i owns images[image_offsets[i]:image_offsets[i + 1]]
+        drill_columns = {
+            "drill_ids": [],
+            "session_ids": [],
+            "image_offsets": [0],
+            "images": []
+        }
+        manifest['drill_columns'] = drill_columns
+    else:
+        manifest['drills'] = {}
+    
     sessions_count = 0
     drills_count = 0
     images_count = 0
@@ -52,10 +75,16 @@ def create_hblib(library_json_path, images_dir, output_hblib_path):
             drills_count += 1
             
             if 'images' in drill and drill['images']:
-                manifest['drills'][drill_id] = {
-                    "session_id": session_id,
-                    "images": []
-                }
+                if columnar_manifest:
+                    drill_columns['drill_ids'].append(drill_id)
+                    drill_columns['session_ids'].append(session_id)
+                    drill_images = drill_columns['images']
+                else:
+                    drill_images = []
+                    manifest['drills'][drill_id] = {
+                        "session_id": session_id,
+                        "images": drill_images
+                    }
                 
                 for img in drill['images']:
                     # Original path: drill_images/TE_078/TE_078_page_2.png
@@ -63,19 +92,23 @@ def create_hblib(library_json_path, images_dir, output_hblib_path):
                     original_path = img['path']
                     
                     # Replace drill_images with drill_images_v2
-                    new_path = original_path.replace('drill_images/', 'drill_images_v2/')
+                    new_path = (ARCHIVE_IMAGE_PREFIX + original_path[len(SOURCE_IMAGE_PREFIX):]
+                                if original_path.startswith(SOURCE_IMAGE_PREFIX) else original_path)
                     
-                    manifest['drills'][drill_id]['images'].append(new_path)
+                    drill_images.append(new_path)
                     
-                    # Add to files to include in ZIP (use set to avoid duplicates)
-                    if os.path.exists(original_path):
-                        image_files_set.add((original_path, new_path))
+                    # Add to files to include in ZIP (dict avoids duplicates)
+                    if image_exists(original_path, dir_cache):
+                        image_files_map[original_path] = new_path
                         images_count += 1
                     else:
                         print(f"  Warning: Image not found: {original_path}")
+                
+                if columnar_manifest:
+                    drill_columns['image_offsets'].append(len(drill_images))
     
-    # Convert set to list for processing
-    image_files = sorted(list(image_files_set))
+    # Sort (source path, archive path) pairs for processing
+    image_files = sorted(image_files_map.items())
     
     print(f"  Sessions: {sessions_count}")
     print(f"  Drills: {drills_count}")
@@ -83,22 +116,37 @@ def create_hblib(library_json_path, images_dir, output_hblib_path):
     print(f"  Unique images: {len(image_files)}")
     
     # Create ZIP file (.hblib)
-    with zipfile.ZipFile(output_hblib_path, 'w', zipfile.ZIP_DEFLATED) as zf:
+    # JSON is deflated, images are stored as-is
+    with open(output_hblib_path, 'wb', buffering=IO_BUFFER_SIZE) as raw, \
+            zipfile.ZipFile(raw, 'w', zipfile.ZIP_DEFLATED,
+                            compresslevel=6, allowZip64=True) as zf:
         # Add library.json
         print("  Adding library.json...")
-        zf.writestr('library.json', json.dumps(library_data, ensure_ascii=False, indent=2))
-        
-        # Add manifest
-        print("  Adding image manifest...")
-        zf.writestr('images/drill_images_manifest_v2.json', 
-                   json.dumps(manifest, ensure_ascii=False, indent=2))
+        write_json(zf, 'library.json', library_data, pretty=True)
         
-        # Add all images
+        # Add all images (uncompressed)
         print(f"  Adding {len(image_files)} images...")
-        for i, (original_path, zip_path) in enumerate(image_files, 1):
+        image_hashes = {}  # SHA-256 digest -> archive path of first copy
+        aliases = {}  # archive path -> archive path with identical content
+        image_data = read_images([original_path for original_path, _ in image_files])
+        for i, ((original_path, zip_path), (data, st)) in enumerate(zip(image_files, image_data), 1):
             if i % 50 == 0:
                 print(f"    Progress: {i}/{len(image_files)}")
-            zf.write(original_path, f'images/{zip_path}')
+            if dedupe_images:
+                digest = hashlib.sha256(data).digest()
+                if digest in image_hashes:
+                    aliases[zip_path] = image_hashes[digest]
+                    continue
+                image_hashes[digest] = zip_path
+            add_image(zf, f'images/{zip_path}', data, st)
+        
+        if aliases:
+            print(f"  Duplicate images (stored once): {len(aliases)}")
+            manifest['aliases'] = aliases
+        
+        # Add manifest (after the images, so it can list aliases)
+        print("  Adding image manifest...")
+        write_json(zf, 'images/drill_images_manifest_v2.json', manifest, pretty=True)
     
     file_size_mb = os.path.getsize(output_hblib_path) / (1024 * 1024)
     print(f"✓ Created {output_hblib_path} ({file_size_mb:.1f} MB)")
@@ -4,57 +4,41 @@ Create optimized .hblib package with minimal JSON size.
 Removes verbose text content and keeps only essential data.
 """
 
-import json
 import zipfile
 import os
+from operator import itemgetter
 from pathlib import Path
 from datetime import datetime
 
-def optimize_library_json(library_data):
-    """
-    Optimize library JSON by removing verbose content.
-    Keep only essential data for the app.
-    """
-    optimized = {
-        "library_version": library_data.get("library_version", "v4_optimized"),
-        "source": "optimized_for_mobile",
-        "sessions": []
-    }
-    
-    for session in library_data.get('sessions', []):
-        optimized_session = {
-            "id": session['id'],
-            "title": session['title'],
-            "duration_total_min": session['duration_total_min'],
-            "tags": session.get('tags', {}),
-            "drills": []
-        }
-        
-        for drill in session.get('drills', []):
-            # Nur die wichtigsten Text-Felder behalten
-            text = drill.get('text', {})
-            optimized_drill = {
-                "drill_id": drill['drill_id'],
-                "title": drill['title'],
-                "duration_min": drill['duration_min'],
-                "phase": drill['phase'],
-                "text": {
-                    "setup": text.get('setup', ''),
-                    "execution": text.get('execution', ''),
-                    "coaching_points": text.get('coaching_points', ''),
-                    "variations": text.get('variations', '')
-                },
-                "tags": drill.get('tags', {}),
-                "images": drill.get('images', [])
-            }
-            
-            optimized_session['drills'].append(optimized_drill)
-        
-        optimized['sessions'].append(optimized_session)
-    
-    return optimized
+from hblib_utils import (ARCHIVE_IMAGE_PREFIX, IO_BUFFER_SIZE, SOURCE_IMAGE_PREFIX,
+                         add_image, image_exists, read_images, write_json)
+from json_utils import dumps_compact, load_json
+
+# Short keys for drill objects (optional, see create_hblib_optimized)
+KEY_MAP = {
+    'drill_id': 'i',
+    'title': 't',
+    'duration_min': 'd',
+    'phase': 'p',
+    'text': 'x',
+    'setup': 's',
+    'execution': 'e',
+    'coaching_points': 'c',
+    'variations': 'v',
+    'tags': 'g',
+    'images': 'm',
+}
+# Reverse table (short -> long), stored as "_keymap" so the app can rehydrate
+KEY_UNMAP = {short: key for key, short in KEY_MAP.items()}
+
+# Text fields kept for the app (empty ones are dropped with omit_empty)
+TEXT_FIELDS = ('setup', 'execution', 'coaching_points', 'variations')
+get_text_fields = itemgetter(*TEXT_FIELDS)
 
-def create_hblib_optimized(library_json_path, images_dir, output_hblib_path):
+def create_hblib_optimized(library_json_path, images_dir, output_hblib_path,
+                           compression=zipfile.ZIP_DEFLATED, compresslevel=6,
+                           short_keys=False, columnar_manifest=False, omit_empty=False,
+                           library_data=None):
     """
     Create optimized .hblib package with minimal JSON.
     
@@ -62,89 +46,186 @@ def create_hblib_optimized(library_json_path, images_dir, output_hblib_path):
         library_json_path: Path to library_with_full_pages.json
         images_dir: Path to drill_images/ directory
         output_hblib_path: Output path for .hblib file
+        compression: ZIP method for the JSON entries (e.g. zipfile.ZIP_ZSTANDARD
+            on Python 3.14+, if the app can read it)
+        compresslevel: Compression level for the JSON entries
+        short_keys: Write drill objects with the short keys from KEY_MAP
+            (adds "_keymap" to library.json; the app must rehydrate them)
+        columnar_manifest: Write the manifest drills as parallel lists under
+            "drill_columns" instead of one dict per drill (the app must support it)
+        omit_empty: Leave out empty text fields and empty "text", "tags" and
+            "images" keys of drills (the app must treat missing keys as empty)
+        library_data: Already parsed library JSON (skips loading library_json_path)
     """
     print(f"Creating optimized {output_hblib_path}...")
     
-    # Load and optimize library JSON
-    with open(library_json_path, 'r', encoding='utf-8') as f:
-        library_data = json.load(f)
-    
-    print("  Optimizing JSON...")
-    optimized_data = optimize_library_json(library_data)
-    
-    # Create compact JSON string (no indentation)
-    compact_json = json.dumps(optimized_data, ensure_ascii=False, separators=(',', ':'))
-    
-    original_size = len(json.dumps(library_data, ensure_ascii=False))
-    optimized_size = len(compact_json)
-    print(f"  JSON size: {original_size / 1024 / 1024:.1f} MB → {optimized_size / 1024 / 1024:.1f} MB ({optimized_size * 100 / original_size:.0f}%)")
+    # Load library JSON
+    original_size = None
+    if library_data is None:
+        library_data = load_json(library_json_path)
+        # Input file size as reference (avoids serializing the full library again)
+        original_size = os.path.getsize(library_json_path)
     
     # Create image manifest
     manifest = {
         "version": "v2",
         "root": "drill_images_v2",
         "type": "full_page_screenshots",
-        "created_at": datetime.now().isoformat(),
-        "drills": {}
+        "created_at": datetime.now().isoformat()
     }
     
-    # Collect all drill images (use set to avoid duplicates)
-    image_files_set = set()
+    optimized_header = {
+        "library_version": library_data.get("library_version", "v4_optimized"),
+        "source": "optimized_for_mobile"
+    }
+    if short_keys:
+        optimized_header["_keymap"] = KEY_UNMAP
+        keys = KEY_MAP
+    else:
+        keys = {key: key for key in KEY_MAP}
+    # Resolve the drill key names once, outside the drill loop
+    drill_id_key, title_key, duration_key, phase_key = (
+        keys['drill_id'], keys['title'], keys['duration_min'], keys['phase'])
+    text_key, tags_key, images_key = keys['text'], keys['tags'], keys['images']
+    text_keys = [keys[field] for field in TEXT_FIELDS]
+    image_files_map = {}
+    dir_cache = {}
+    if columnar_manifest:
+        # Drill i owns images[image_offsets[i]:image_offsets[i + 1]]
+        drill_columns = {
+            "drill_ids": [],
+            "session_ids": [],
+            "image_offsets": [0],
+            "images": []
+        }
+        manifest['drill_columns'] = drill_columns
+    else:
+        manifest['drills'] = {}
+    
     sessions_count = 0
     drills_count = 0
     images_count = 0
     
-    for session in optimized_data.get('sessions', []):
-        session_id = session['id']
-        sessions_count += 1
-        
-        for drill in session.get('drills', []):
-            drill_id = drill['drill_id']
-            drills_count += 1
+    # Create ZIP file (.hblib)
+    # JSON is deflated, images are stored as-is
+    with open(output_hblib_path, 'wb', buffering=IO_BUFFER_SIZE) as raw, \
+            zipfile.ZipFile(raw, 'w', compression,
+                            compresslevel=compresslevel, allowZip64=True) as zf:
+        # Optimize JSON and collect drill images in a single pass
+        # (keyed by source path to avoid duplicate images).
+        # Sessions are written to library.json one at a time (compact, no
+        # indentation), so the optimized library is never held in full.
+        print("  Adding optimized library.json...")
+        with zf.open('library.json', 'w') as fp:
+            fp.write(dumps_compact(optimized_header)[:-1] + b',"sessions":[')
             
-            if 'images' in drill and drill['images']:
-                manifest['drills'][drill_id] = {
-                    "session_id": session_id,
-                    "images": []
+            for session in library_data.get('sessions', []):
+                session_id = session['id']
+                sessions_count += 1
+                
+                optimized_session = {
+                    "id": session_id,
+                    "title": session['title'],
+                    "duration_total_min": session['duration_total_min'],
+                    "tags": session.get('tags', {}),
+                    "drills": []
                 }
+                drills_append = optimized_session['drills'].append
                 
-                for img in drill['images']:
-                    original_path = img['path']
-                    new_path = original_path.replace('drill_images/', 'drill_images_v2/')
+                for drill in session.get('drills', []):
+                    drill_id = drill['drill_id']
+                    drills_count += 1
                     
-                    manifest['drills'][drill_id]['images'].append(new_path)
+                    optimized_drill = {
+                        drill_id_key: drill_id,
+                        title_key: drill['title'],
+                        duration_key: drill['duration_min'],
+                        phase_key: drill['phase']
+                    }
                     
-                    if os.path.exists(original_path):
-                        image_files_set.add((original_path, new_path))
-                        images_count += 1
+                    # Nur die wichtigsten Text-Felder behalten
+                    text = drill.get('text', {})
+                    try:
+                        text_values = get_text_fields(text)
+                    except KeyError:
+                        text_values = [text.get(field, '') for field in TEXT_FIELDS]
+                    tags = drill.get('tags', {})
+                    images = drill.get('images', [])
+                    if omit_empty:
+                        # Leere Felder weglassen
+                        text_out = {key: value for key, value in zip(text_keys, text_values) if value}
+                        if text_out:
+                            optimized_drill[text_key] = text_out
+                        if tags:
+                            optimized_drill[tags_key] = tags
+                        if images:
+                            optimized_drill[images_key] = images
                     else:
-                        print(f"  Warning: Image not found: {original_path}")
-    
-    # Convert set to list for processing
-    image_files = sorted(list(image_files_set))
-    
-    print(f"  Sessions: {sessions_count}")
-    print(f"  Drills: {drills_count}")
-    print(f"  Image references: {images_count}")
-    print(f"  Unique images: {len(image_files)}")
-    
-    # Create ZIP file (.hblib)
-    with zipfile.ZipFile(output_hblib_path, 'w', zipfile.ZIP_DEFLATED, compresslevel=9) as zf:
-        # Add optimized library.json (compact, no indentation)
-        print("  Adding optimized library.json...")
-        zf.writestr('library.json', compact_json)
+                        optimized_drill[text_key] = dict(zip(text_keys, text_values))
+                        optimized_drill[tags_key] = tags
+                        optimized_drill[images_key] = images
+                    
+                    drills_append(optimized_drill)
+                    
+                    if images:
+                        if columnar_manifest:
+                            drill_columns['drill_ids'].append(drill_id)
+                            drill_columns['session_ids'].append(session_id)
+                            drill_images = drill_columns['images']
+                        else:
+                            drill_images = []
+                            manifest['drills'][drill_id] = {
+                                "session_id": session_id,
+                                "images": drill_images
+                            }
+                        
+                        for img in images:
+                            original_path = img['path']
+                            new_path = (ARCHIVE_IMAGE_PREFIX + original_path[len(SOURCE_IMAGE_PREFIX):]
+                                        if original_path.startswith(SOURCE_IMAGE_PREFIX) else original_path)
+                            
+                            drill_images.append(new_path)
+                            
+                            if image_exists(original_path, dir_cache):
+                                image_files_map[original_path] = new_path
+                                images_count += 1
+                            else:
+                                print(f"  Warning: Image not found: {original_path}")
+                        
+                        if columnar_manifest:
+                            drill_columns['image_offsets'].append(len(drill_images))
+                
+                if sessions_count > 1:
+                    fp.write(b',')
+                fp.write(dumps_compact(optimized_session))
+            
+            fp.write(b']}')
+        
+        optimized_size = zf.getinfo('library.json').file_size
+        if original_size:
+            print(f"  JSON size: {original_size / 1024 / 1024:.1f} MB → {optimized_size / 1024 / 1024:.1f} MB ({optimized_size * 100 / original_size:.0f}%)")
+        else:
+            print(f"  JSON size: {optimized_size / 1024 / 1024:.1f} MB")
+        
+        # Sort (source path, archive path) pairs for processing
+        image_files = sorted(image_files_map.items())
+        
+        print(f"  Sessions: {sessions_count}")
+        print(f"  Drills: {drills_count}")
+        print(f"  Image references: {images_count}")
+        print(f"  Unique images: {len(image_files)}")
         
         # Add manifest (also compact)
         print("  Adding image manifest...")
-        compact_manifest = json.dumps(manifest, ensure_ascii=False, separators=(',', ':'))
-        zf.writestr('images/drill_images_manifest_v2.json', compact_manifest)
+        write_json(zf, 'images/drill_images_manifest_v2.json', manifest)
         
-        # Add all images
+        # Add all images (uncompressed)
         print(f"  Adding {len(image_files)} images...")
-        for i, (original_path, zip_path) in enumerate(image_files, 1):
+        image_data = read_images([original_path for original_path, _ in image_files])
+        for i, ((original_path, zip_path), (data, st)) in enumerate(zip(image_files, image_data), 1):
             if i % 50 == 0:
                 print(f"    Progress: {i}/{len(image_files)}")
-            zf.write(original_path, f'images/{zip_path}')
+            add_image(zf, f'images/{zip_path}', data, st)
     
     file_size_mb = os.path.getsize(output_hblib_path) / (1024 * 1024)
     print(f"✓ Created {output_hblib_path} ({file_size_mb:.1f} MB)")
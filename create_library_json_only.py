@@ -4,10 +4,21 @@ Create library.json without images for direct download.
 Images will be downloaded on-demand by the app.
 """
 
-import json
+import os
 from datetime import datetime
+from operator import itemgetter
 
-def create_library_json_for_app(input_json_path, output_json_path, base_image_url):
+from json_utils import dumps_compact, load_json
+
+# Text fields kept for the app (empty ones are dropped with omit_empty)
+TEXT_FIELDS = ('setup', 'execution', 'coaching_points', 'variations')
+get_text_fields = itemgetter(*TEXT_FIELDS)
+
+# Field order of positional image records (see compact_images)
+IMAGES_SCHEMA = ['page', 'order', 'type', 'url']
+
+def create_library_json_for_app(input_json_path, output_json_path, base_image_url,
+                                compact_images=False, omit_empty=False, library_data=None):
     """
     Create optimized library.json with remote image URLs.
     
@@ -15,81 +26,108 @@ def create_library_json_for_app(input_json_path, output_json_path, base_image_ur
         input_json_path: Path to library_with_full_pages.json
         output_json_path: Output path for optimized library.json
         base_image_url: Base URL for images (e.g., https://raw.githubusercontent.com/.../drill_images/)
+        compact_images: Write images as [page, order, type, url] lists instead
+            of dicts (adds "images_schema"; the app must support it)
+        omit_empty: Leave out empty text fields and empty "text", "tags" and
+            "images" keys of drills (the app must treat missing keys as empty)
+        library_data: Already parsed library JSON (skips loading input_json_path)
     """
     print(f"Creating app-ready library.json...")
     
     # Load library JSON
-    with open(input_json_path, 'r', encoding='utf-8') as f:
-        library_data = json.load(f)
+    if library_data is None:
+        library_data = load_json(input_json_path)
     
     # Optimize and add remote URLs
-    optimized = {
+    header = {
         "library_version": "v15",
         "source": "optimized_for_mobile_with_remote_images",
         "created_at": datetime.now().isoformat(),
-        "image_base_url": base_image_url,
-        "sessions": []
+        "image_base_url": base_image_url
     }
+    if compact_images:
+        header["images_schema"] = IMAGES_SCHEMA
     
     sessions_count = 0
     drills_count = 0
     images_count = 0
     
-    for session in library_data.get('sessions', []):
-        sessions_count += 1
-        
-        optimized_session = {
-            "id": session['id'],
-            "title": session['title'],
-            "duration_total_min": session['duration_total_min'],
-            "tags": session.get('tags', {}),
-            "drills": []
-        }
+    # Speichere als kompaktes JSON, Session für Session
+    # (die optimierte Bibliothek wird nie komplett im Speicher gehalten)
+    with open(output_json_path, 'wb') as f:
+        f.write(dumps_compact(header)[:-1] + b',"sessions":[')
         
-        for drill in session.get('drills', []):
-            drills_count += 1
+        for session in library_data.get('sessions', []):
+            sessions_count += 1
             
-            # Nur die wichtigsten Text-Felder behalten
-            text = drill.get('text', {})
-            optimized_drill = {
-                "drill_id": drill['drill_id'],
-                "title": drill['title'],
-                "duration_min": drill['duration_min'],
-                "phase": drill['phase'],
-                "text": {
-                    "setup": text.get('setup', ''),
-                    "execution": text.get('execution', ''),
-                    "coaching_points": text.get('coaching_points', ''),
-                    "variations": text.get('variations', '')
-                },
-                "tags": drill.get('tags', {}),
-                "images": []
+            optimized_session = {
+                "id": session['id'],
+                "title": session['title'],
+                "duration_total_min": session['duration_total_min'],
+                "tags": session.get('tags', {}),
+                "drills": []
             }
+            drills_append = optimized_session['drills'].append
             
-            # Konvertiere lokale Pfade zu Remote-URLs
-            for img in drill.get('images', []):
-                images_count += 1
-                local_path = img['path']  # z.B. drill_images/TE_078/TE_078_page_2.png
+            for drill in session.get('drills', []):
+                drills_count += 1
                 
-                # Erstelle Remote-URL
-                remote_url = f"{base_image_url}{local_path}"
+                optimized_drill = {
+                    "drill_id": drill['drill_id'],
+                    "title": drill['title'],
+                    "duration_min": drill['duration_min'],
+                    "phase": drill['phase']
+                }
                 
-                optimized_drill['images'].append({
-                    "url": remote_url,
-                    "page": img.get('page'),
-                    "order": img.get('order'),
-                    "type": img.get('type', 'full_page')
-                })
+                # Nur die wichtigsten Text-Felder behalten
+                text = drill.get('text', {})
+                try:
+                    text_values = get_text_fields(text)
+                except KeyError:
+                    text_values = [text.get(field, '') for field in TEXT_FIELDS]
+                tags = drill.get('tags', {})
+                if omit_empty:
+                    # Leere Felder weglassen
+                    text_out = {field: value for field, value in zip(TEXT_FIELDS, text_values) if value}
+                    if text_out:
+                        optimized_drill['text'] = text_out
+                    if tags:
+                        optimized_drill['tags'] = tags
+                else:
+                    optimized_drill['text'] = dict(zip(TEXT_FIELDS, text_values))
+                    optimized_drill['tags'] = tags
+                
+                # Konvertiere lokale Pfade zu Remote-URLs
+                images = []
+                for img in drill.get('images', []):
+                    images_count += 1
+                    local_path = img['path']  # z.B. drill_images/TE_078/TE_078_page_2.png
+                    
+                    # Erstelle Remote-URL
+                    remote_url = f"{base_image_url}{local_path}"
+                    
+                    if compact_images:
+                        images.append([img.get('page'), img.get('order'),
+                                       img.get('type', 'full_page'), remote_url])
+                    else:
+                        images.append({
+                            "url": remote_url,
+                            "page": img.get('page'),
+                            "order": img.get('order'),
+                            "type": img.get('type', 'full_page')
+                        })
+                if images or not omit_empty:
+                    optimized_drill['images'] = images
+                
+                drills_append(optimized_drill)
             
-            optimized_session['drills'].append(optimized_drill)
+            if sessions_count > 1:
+                f.write(b',')
+            f.write(dumps_compact(optimized_session))
         
-        optimized['sessions'].append(optimized_session)
-    
-    # Speichere als kompaktes JSON
-    with open(output_json_path, 'w', encoding='utf-8') as f:
-        json.dump(optimized, f, ensure_ascii=False, separators=(',', ':'))
+        f.write(b']}')
     
-    file_size_kb = len(json.dumps(optimized, ensure_ascii=False)) / 1024
+    file_size_kb = os.path.getsize(output_json_path) / 1024
     print(f"✓ Created {output_json_path} ({file_size_kb:.1f} KB)")
     print(f"  Sessions: {sessions_count}")
     print(f"  Drills: {drills_count}")
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Helpers shared by the .hblib builders
+(create_hblib.py and create_hblib_optimized.py).
+"""
+
+import os
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from json_utils import dump_json
+
+# Image paths in the library JSON vs. in the .hblib archive
+SOURCE_IMAGE_PREFIX = 'drill_images/'
+ARCHIVE_IMAGE_PREFIX = 'drill_images_v2/'
+
+# Buffer size for the archive output file
+IO_BUFFER_SIZE = 1024 * 1024
+
+def read_image(path):
+    """Read an image file into memory, together with its stat() result."""
+    with open(path, 'rb') as f:
+        return f.read(), os.fstat(f.fileno())
+
+def read_images(paths, workers=None):
+    """
+    Read image files on a thread pool, yielding (bytes, stat) in order.
+    A bounded number of reads run ahead so disk I/O overlaps with
+    writing the archive.
+    """
+    workers = workers or os.cpu_count() or 1
+    window = workers * 4
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for path in paths:
+            pending.append(pool.submit(read_image, path))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def add_image(zf, arcname, data, st):
+    """
+    Add an image (as returned by read_image) to the archive without
+    recompressing it. PNG/JPEG data is already compressed, so DEFLATE
+    only costs CPU. Timestamp and mode are taken from st, as zf.write() does.
+    """
+    zinfo = zipfile.ZipInfo(arcname, time.localtime(st.st_mtime)[:6])
+    zinfo.external_attr = (st.st_mode & 0xFFFF) << 16
+    zinfo.compress_type = zipfile.ZIP_STORED
+    zf.writestr(zinfo, data)
+
+def write_json(zf, arcname, data, pretty=False):
+    """Write data as JSON into the archive, streaming it to the compressor."""
+    with zf.open(arcname, 'w') as raw:
+        dump_json(data, raw, pretty=pretty)
+
+def image_exists(path, dir_cache):
+    """
+    Check whether an image file exists.
+    Each directory is listed once and cached, instead of one stat() per image.
+    """
+    directory, name = os.path.split(path)
+    if directory not in dir_cache:
+        try:
+            dir_cache[directory] = set(os.listdir(directory or '.'))
+        except OSError:
+            dir_cache[directory] = set()
+    return name in dir_cache[directory]
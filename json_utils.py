@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+JSON helpers shared by the library scripts.
+Uses orjson when installed (much faster, emits UTF-8 bytes directly),
+otherwise the json module of the standard library.
+"""
+
+import io
+import json
+
+try:
+    import orjson  # Optional, much faster JSON encoding/decoding
+except ImportError:
+    orjson = None
+
+def load_json(path):
+    """Load a JSON file, parsing the raw bytes with orjson when available."""
+    if orjson is not None:
+        with open(path, 'rb') as f:
+            return orjson.loads(f.read())
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def dumps_compact(data):
+    """Encode data as compact UTF-8 JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def dump_json(data, fp, pretty=False):
+    """
+    Write data as JSON (UTF-8) to the binary file object fp.
+    Without orjson the stdlib encoder streams chunks to fp instead of
+    building the full JSON string in memory first.
+    """
+    if orjson is not None:
+        fp.write(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS if pretty else 0))
+        return
+    json_kwargs = {'indent': 2} if pretty else {'separators': (',', ':')}
+    text_fp = io.TextIOWrapper(fp, encoding='utf-8')
+    json.dump(data, text_fp, ensure_ascii=False, **json_kwargs)
+    text_fp.detach()  # Flushes, but leaves fp open
+
+def save_json(path, data):
+    """Write data as indented UTF-8 JSON to a file."""
+    with open(path, 'wb') as f:
+        dump_json(data, f, pretty=True)
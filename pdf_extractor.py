@@ -5,11 +5,111 @@ Extracts training session data from PDF files and updates library.json
 """
 
 import fitz  # PyMuPDF
-import json
 import re
 import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
+
+from json_utils import load_json, save_json
+
+try:
+    from tqdm import tqdm  # Optional progress bar for update_library
+except ImportError:
+    tqdm = None
+
+
+# Precompiled patterns
+_SESSION_ID_RE = re.compile(r'(\d+)')
+_DIGITS_ONLY_RE = re.compile(r'^\d+$')
+# "90 Minuten", "75 Min.", "60 min" in one pattern; the suffix group tells them apart
+_DURATION_RE = re.compile(r'(\d+)\s*min(uten|\.)?', re.IGNORECASE)
+_DAUER_RE = re.compile(r'Dauer:\s*(\d+)', re.IGNORECASE)
+_EQUIPMENT_RES = [
+    re.compile(pattern, re.DOTALL | re.IGNORECASE)
+    for pattern in (
+        r'(?:Material|Benötigtes Material|Equipment):\s*\n(.*?)(?:\n\n|\nAblauf|\nGrundaufbau)',
+        r'(?:Material|Benötigtes Material):\s*([^\n]+(?:\n[^\n]+)*?)(?:\n\n|\nAblauf)',
+    )
+]
+# Bullet characters separating equipment items, mapped to newlines for str.split
+_BULLET_TABLE = str.maketrans('•-\u0001', '\n\n\n')
+# Drill headers like "Übung 1: Name (15 Min)"
+_DRILL_RE = re.compile(r'(?:Übung|Drill|Teil)\s*(\d+)[:\s]+(.*?)(?:\((\d+)\s*Min)', re.IGNORECASE)
+# Drill phase keywords, in priority order (first hit wins)
+_PHASE_KEYWORDS = {
+    'einlaufen': "Warm-up",
+    'aufwärmen': "Warm-up",
+    'warm': "Warm-up",
+    'dehnen': "Warm-up",
+    'koordination': "Koordination",
+    'lauf': "Koordination",
+    'ballgewöhnung': "Ballhandling",
+    'ballhandling': "Ballhandling",
+    'passen': "Ballhandling",
+    'torhüter': "Torhüter",
+    'torwart': "Torhüter",
+    'einwerfen': "Torhüter",
+    'wurfserie': "Wurfserie",
+    'werfen': "Wurfserie",
+    'angriff': "Angriff",
+    'offensive': "Angriff",
+    'abwehr': "Abwehr",
+    'defensive': "Abwehr",
+    'spiel': "Spiel",
+    'abschluss': "Spiel",
+}
+# Canonical equipment tags and their keywords (matched in lowercased equipment text)
+_EQUIPMENT_TAGS = {
+    "Hütchen": ["hütchen", "kegel"],
+    "Ballkiste": ["ballkiste", "bälle"],
+    "Reifen": ["reifen", "ring"],
+    "Koordinationsleiter": ["koordinationsleiter", "leiter"],
+    "Turnkisten": ["turnkiste", "kasten"],
+    "Turnmatte": ["matte", "turnmatte"],
+}
+# One scan for all keywords; the lookahead also finds keywords that overlap
+_EQUIP_TAG_RE = re.compile('(?=' + '|'.join(
+    f'(?P<{tag}>' + '|'.join(map(re.escape, keywords)) + ')'
+    for tag, keywords in _EQUIPMENT_TAGS.items()
+) + ')')
+
+
+def _new_drill(drill_id: str, title: str, duration: int, cumulative_min: int, phase: str,
+               source_page_start: int, requires_goalkeeper: bool = False) -> Dict[str, Any]:
+    """Create a drill with empty text, bullets and default tags"""
+    # Plain literals: building the dict is much cheaper than deepcopy() of a template
+    return {
+        "drill_id": drill_id,
+        "title": title,
+        "duration_min": duration,
+        "cumulative_min": cumulative_min,
+        "phase": phase,
+        "source_page_start": source_page_start,
+        "text": {
+            "preface": "",
+            "setup": "",
+            "execution": "",
+            "coaching_points": "",
+            "variations": "",
+            "goal": "",
+            "raw_rest": ""
+        },
+        "text_bullets": {
+            "setup": [],
+            "execution": [],
+            "coaching_points": [],
+            "variations": [],
+            "goal": []
+        },
+        "tags": {
+            "formation": "unbekannt",
+            "concept_tags": [],
+            "drill_level": "unbekannt",
+            "requires_goalkeeper": requires_goalkeeper
+        },
+        "images": []
+    }
 
 
 class HandballPDFExtractor:
@@ -22,7 +122,7 @@ class HandballPDFExtractor:
         self.extract_images = extract_images
         
         # Extract session ID from filename
-        match = re.search(r'(\d+)', self.filename)
+        match = _SESSION_ID_RE.search(self.filename)
         self.session_id = int(match.group(1)) if match else None
         
         # Setup image output directory
@@ -34,18 +134,21 @@ class HandballPDFExtractor:
         if self.extract_images:
             self.image_dir.mkdir(parents=True, exist_ok=True)
         
-    def extract_images_from_page(self, page_num: int) -> List[Dict[str, Any]]:
-        """Extract all images from a specific page"""
+        # Relative path of each image xref already written (logos etc. repeat across pages)
+        self._xref_cache: Dict[int, str] = {}
+        
+    def extract_images_from_page(self, page_num: int, image_list: list) -> List[Dict[str, Any]]:
+        """Extract all images from a specific page (image_list from _read_page)"""
         images = []
-        page = self.doc[page_num - 1]  # page_num is 1-based
         
-        try:
-            image_list = page.get_images(full=True)
+        for img_index, img_info in enumerate(image_list, start=1):
+            xref = img_info[0]
             
-            for img_index, img_info in enumerate(image_list, start=1):
-                xref = img_info[0]
+            try:
+                # Reuse the file of an image seen earlier in this PDF
+                relative_path = self._xref_cache.get(xref)
                 
-                try:
+                if relative_path is None:
                     # Extract image
                     base_image = self.doc.extract_image(xref)
                     image_bytes = base_image["image"]
@@ -57,41 +160,40 @@ class HandballPDFExtractor:
                     
                     # Save image
                     if self.extract_images:
-                        with open(image_path, "wb") as img_file:
-                            img_file.write(image_bytes)
+                        image_path.write_bytes(image_bytes)
                     
                     # Store relative path
                     relative_path = f"drill_images/TE_{self.session_id:03d}/{image_filename}"
-                    
-                    images.append({
-                        "path": relative_path,
-                        "page": page_num,
-                        "order": img_index
-                    })
-                    
-                except Exception as e:
-                    print(f"    Warning: Could not extract image {img_index} from page {page_num}: {e}")
-                    
-        except Exception as e:
-            print(f"    Warning: Could not get images from page {page_num}: {e}")
-        
+                    self._xref_cache[xref] = relative_path
+                
+                images.append({
+                    "path": relative_path,
+                    "page": page_num,
+                    "order": img_index
+                })
+                
+            except Exception as e:
+                print(f"    Warning: Could not extract image {img_index} from page {page_num}: {e}")
+                
         return images
     
-    def extract_text_by_page(self) -> List[str]:
-        """Extract text from each page"""
-        pages = []
-        for page_num in range(len(self.doc)):
-            page = self.doc[page_num]
-            text = page.get_text()
-            pages.append(text)
-        return pages
-        """Extract text from each page"""
+    def _read_page(self, page) -> Tuple[str, Optional[list]]:
+        """Extract the text and (if images are extracted) the image list of a page"""
+        # Blank pages have no content stream; skip text extraction for them
+        text = page.get_text() if page.get_contents() else ""
+        # Only an xref table lookup, the images themselves are not decoded
+        image_list = page.get_images(full=False) if self.extract_images else None
+        return text, image_list
+    
+    def extract_pages(self) -> Tuple[List[str], List[Optional[list]]]:
+        """Extract text and image lists of all pages in a single pass"""
         pages = []
-        for page_num in range(len(self.doc)):
-            page = self.doc[page_num]
-            text = page.get_text()
+        image_lists = []
+        for page in self.doc:
+            text, image_list = self._read_page(page)
             pages.append(text)
-        return pages
+            image_lists.append(image_list)
+        return pages, image_lists
     
     def extract_title(self, first_page_text: str) -> str:
         """Extract session title from first page"""
@@ -132,7 +234,7 @@ class HandballPDFExtractor:
                 'Seite' not in line and
                 'handball-uebungen' not in line and
                 not line.startswith('http') and
-                not re.match(r'^\d+$', line)):
+                not _DIGITS_ONLY_RE.match(line)):
                 candidates.append(line)
         
         if candidates:
@@ -143,18 +245,25 @@ class HandballPDFExtractor:
     def extract_duration(self, text: str) -> int:
         """Extract total duration in minutes"""
         # Look for patterns like "90 Minuten", "75 Min", etc.
-        patterns = [
-            r'(\d+)\s*Minuten',
-            r'(\d+)\s*Min\.',
-            r'(\d+)\s*min',
-            r'Dauer:\s*(\d+)',
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
+        # Preference: first "Minuten", else first "Min.", else first "min",
+        # else "Dauer:". A "Minuten" hit ends the scan right away.
+        min_dot = None
+        min_plain = None
+        for match in _DURATION_RE.finditer(text):
+            suffix = match.group(2)
+            if suffix is None:
+                if min_plain is None:
+                    min_plain = match
+            elif suffix == '.':
+                if min_dot is None:
+                    min_dot = match
+            else:
                 return int(match.group(1))
         
+        match = min_dot or min_plain or _DAUER_RE.search(text)
+        if match:
+            return int(match.group(1))
+        
         return 90  # Default
     
     def extract_equipment(self, text: str) -> List[str]:
@@ -162,28 +271,27 @@ class HandballPDFExtractor:
         equipment = []
         
         # Look for "Material:" or "Benötigtes Material:" section
-        patterns = [
-            r'(?:Material|Benötigtes Material|Equipment):\s*\n(.*?)(?:\n\n|\nAblauf|\nGrundaufbau)',
-            r'(?:Material|Benötigtes Material):\s*([^\n]+(?:\n[^\n]+)*?)(?:\n\n|\nAblauf)',
-        ]
-        
-        for pattern in patterns:
-            material_match = re.search(pattern, text, re.DOTALL | re.IGNORECASE)
+        for pattern in _EQUIPMENT_RES:
+            material_match = pattern.search(text)
             if material_match:
                 material_text = material_match.group(1)
                 # Split by bullet points, newlines, or special chars
-                items = re.split(r'[\n•\-\u0001]', material_text)
+                items = material_text.translate(_BULLET_TABLE).split('\n')
                 for item in items:
                     item = item.strip()
-                    # Clean up common prefixes
-                    item = re.sub(r'^\d+[\.\)]\s*', '', item)
+                    # Clean up common prefixes ("1.", "2)")
+                    digits = 0
+                    while digits < len(item) and item[digits].isdecimal():
+                        digits += 1
+                    if digits and item[digits:digits + 1] in ('.', ')'):
+                        item = item[digits + 1:].lstrip()
                     if item and len(item) > 2 and not item.startswith('http'):
                         equipment.append(item)
                 break
         
         return equipment if equipment else ["Bälle", "Hütchen"]
     
-    def extract_drills(self, pages: List[str]) -> List[Dict[str, Any]]:
+    def extract_drills(self, pages: List[str], image_lists: List[Optional[list]]) -> List[Dict[str, Any]]:
         """Extract individual drills from pages"""
         drills = []
         cumulative_min = 0
@@ -191,9 +299,7 @@ class HandballPDFExtractor:
         for page_num, page_text in enumerate(pages, start=1):
             # Look for drill headers with duration
             # Pattern: "Übung 1: Name (15 Min)" or similar
-            drill_pattern = r'(?:Übung|Drill|Teil)\s*(\d+)[:\s]+(.*?)(?:\((\d+)\s*Min)'
-            
-            matches = re.finditer(drill_pattern, page_text, re.IGNORECASE)
+            matches = _DRILL_RE.finditer(page_text)
             
             for match in matches:
                 drill_num = match.group(1)
@@ -202,37 +308,10 @@ class HandballPDFExtractor:
                 
                 cumulative_min += duration
                 
-                drill = {
-                    "drill_id": f"{self.session_id}-{drill_num}",
-                    "title": drill_title,
-                    "duration_min": duration,
-                    "cumulative_min": cumulative_min,
-                    "phase": self._classify_phase(drill_title),
-                    "source_page_start": page_num,
-                    "text": {
-                        "preface": "",
-                        "setup": "",
-                        "execution": "",
-                        "coaching_points": "",
-                        "variations": "",
-                        "goal": "",
-                        "raw_rest": ""
-                    },
-                    "text_bullets": {
-                        "setup": [],
-                        "execution": [],
-                        "coaching_points": [],
-                        "variations": [],
-                        "goal": []
-                    },
-                    "tags": {
-                        "formation": "unbekannt",
-                        "concept_tags": [],
-                        "drill_level": "unbekannt",
-                        "requires_goalkeeper": False
-                    },
-                    "images": []
-                }
+                drill = _new_drill(
+                    f"{self.session_id}-{drill_num}", drill_title, duration, cumulative_min,
+                    self._classify_phase(drill_title), page_num
+                )
                 
                 drills.append(drill)
         
@@ -242,15 +321,16 @@ class HandballPDFExtractor:
         
         # Extract images for all pages and distribute to drills
         if self.extract_images:
-            all_images = []
-            for page_num in range(1, len(pages) + 1):
-                page_images = self.extract_images_from_page(page_num)
-                all_images.extend(page_images)
+            images_by_page = {}
+            for page_num, image_list in enumerate(image_lists, start=1):
+                # Pages without images are skipped
+                if not image_list:
+                    continue
+                images_by_page[page_num] = self.extract_images_from_page(page_num, image_list)
             
             # Distribute images to drills based on page numbers
             for drill in drills:
-                drill_page = drill["source_page_start"]
-                drill["images"] = [img for img in all_images if img["page"] == drill_page]
+                drill["images"] = list(images_by_page.get(drill["source_page_start"], ()))
         
         return drills
     
@@ -258,22 +338,10 @@ class HandballPDFExtractor:
         """Classify drill phase based on title"""
         title_lower = title.lower()
         
-        if any(word in title_lower for word in ['einlaufen', 'aufwärmen', 'warm', 'dehnen']):
-            return "Warm-up"
-        elif any(word in title_lower for word in ['koordination', 'lauf']):
-            return "Koordination"
-        elif any(word in title_lower for word in ['ballgewöhnung', 'ballhandling', 'passen']):
-            return "Ballhandling"
-        elif any(word in title_lower for word in ['torhüter', 'torwart', 'einwerfen']):
-            return "Torhüter"
-        elif any(word in title_lower for word in ['wurfserie', 'werfen']):
-            return "Wurfserie"
-        elif any(word in title_lower for word in ['angriff', 'offensive']):
-            return "Angriff"
-        elif any(word in title_lower for word in ['abwehr', 'defensive']):
-            return "Abwehr"
-        elif any(word in title_lower for word in ['spiel', 'abschluss']):
-            return "Spiel"
+        # First keyword hit wins; keywords are ordered by phase priority
+        for keyword, phase in _PHASE_KEYWORDS.items():
+            if keyword in title_lower:
+                return phase
         
         return "Angriff"  # Default
     
@@ -293,50 +361,23 @@ class HandballPDFExtractor:
         
         for idx, (title, phase, duration) in enumerate(default_phases, start=1):
             cumulative += duration
-            drills.append({
-                "drill_id": f"{self.session_id}-{idx}",
-                "title": title,
-                "duration_min": duration,
-                "cumulative_min": cumulative,
-                "phase": phase,
-                "source_page_start": 2,
-                "text": {
-                    "preface": "",
-                    "setup": "",
-                    "execution": "",
-                    "coaching_points": "",
-                    "variations": "",
-                    "goal": "",
-                    "raw_rest": ""
-                },
-                "text_bullets": {
-                    "setup": [],
-                    "execution": [],
-                    "coaching_points": [],
-                    "variations": [],
-                    "goal": []
-                },
-                "tags": {
-                    "formation": "unbekannt",
-                    "concept_tags": [],
-                    "drill_level": "unbekannt",
-                    "requires_goalkeeper": phase == "Torhüter"
-                },
-                "images": []
-            })
+            drills.append(_new_drill(
+                f"{self.session_id}-{idx}", title, duration, cumulative, phase, 2,
+                requires_goalkeeper=phase == "Torhüter"
+            ))
         
         return drills
     
     def extract_session(self) -> Dict[str, Any]:
         """Extract complete session data"""
-        pages = self.extract_text_by_page()
+        pages, image_lists = self.extract_pages()
         first_page = pages[0] if pages else ""
         all_text = "\n".join(pages)
         
         title = self.extract_title(first_page)
         duration = self.extract_duration(all_text)
         equipment = self.extract_equipment(all_text)
-        drills = self.extract_drills(pages)
+        drills = self.extract_drills(pages, image_lists)
         
         session = {
             "source_file": self.filename,
@@ -361,51 +402,49 @@ class HandballPDFExtractor:
     
     def _extract_equipment_tags(self, equipment: List[str]) -> List[str]:
         """Extract canonical equipment tags"""
-        tags = []
         equipment_text = " ".join(equipment).lower()
+        found = {match.lastgroup for match in _EQUIP_TAG_RE.finditer(equipment_text)}
         
-        tag_mapping = {
-            "Hütchen": ["hütchen", "kegel"],
-            "Ballkiste": ["ballkiste", "bälle"],
-            "Reifen": ["reifen", "ring"],
-            "Koordinationsleiter": ["koordinationsleiter", "leiter"],
-            "Turnkisten": ["turnkiste", "kasten"],
-            "Turnmatte": ["matte", "turnmatte"],
-        }
-        
-        for tag, keywords in tag_mapping.items():
-            if any(keyword in equipment_text for keyword in keywords):
-                tags.append(tag)
-        
-        return tags
+        # Keep the tag order of _EQUIPMENT_TAGS
+        return [tag for tag in _EQUIPMENT_TAGS if tag in found]
     
     def close(self):
         """Close PDF document"""
         self.doc.close()
+        # Drop cached fonts/images; worker processes open many PDFs in a row
+        fitz.TOOLS.store_shrink(100)
+
+
+def _process_pdf(pdf_path: str, extract_images: bool) -> Dict[str, Any]:
+    """Extract a single session (runs in a worker process)"""
+    extractor = HandballPDFExtractor(pdf_path, extract_images=extract_images)
+    try:
+        return extractor.extract_session()
+    finally:
+        extractor.close()
 
 
 def update_library(library_path: str, pdf_dir: str, output_path: str = None, extract_images: bool = True):
     """Update library.json with new sessions from PDF files"""
     
     # Load existing library
-    with open(library_path, 'r', encoding='utf-8') as f:
-        library = json.load(f)
+    library = load_json(library_path)
     
     # Get existing session IDs
-    existing_ids = {session['id'] for session in library['sessions']}
+    existing_ids = frozenset(session['id'] for session in library['sessions'])
     
-    # Find all PDF files
+    # Find all PDF files (new ones are filtered out before any PDF is opened)
     pdf_files = sorted(Path(pdf_dir).glob('*.pdf'))
     
     print(f"Found {len(pdf_files)} PDF files")
     print(f"Existing sessions: {len(existing_ids)}")
     print(f"Image extraction: {'enabled' if extract_images else 'disabled'}")
     
-    new_sessions = []
+    work_items = []
     
     for pdf_file in pdf_files:
         # Extract session ID from filename
-        match = re.search(r'(\d+)', pdf_file.name)
+        match = _SESSION_ID_RE.search(pdf_file.name)
         if not match:
             continue
         
@@ -416,20 +455,53 @@ def update_library(library_path: str, pdf_dir: str, output_path: str = None, ext
             print(f"Skipping {pdf_file.name} (already in library)")
             continue
         
-        print(f"Processing {pdf_file.name}...")
-        
-        try:
-            extractor = HandballPDFExtractor(str(pdf_file), extract_images=extract_images)
-            session = extractor.extract_session()
-            new_sessions.append(session)
-            extractor.close()
+        work_items.append(pdf_file)
+    
+    results = {}
+    
+    # Sessions are independent, so extract them in parallel
+    if work_items:
+        print(f"Processing {len(work_items)} PDFs...")
+        max_workers = min(len(work_items), os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(_process_pdf, str(pdf_file), extract_images): pdf_file
+                for pdf_file in work_items
+            }
+            completed = as_completed(futures)
+            if tqdm is not None:
+                # One redrawn progress line instead of several prints per PDF
+                completed = tqdm(completed, total=len(futures), desc="Extracting", unit="pdf")
+            errors = []
             
-            total_images = sum(len(drill.get('images', [])) for drill in session['drills'])
-            print(f"  ✓ Extracted session {session_id}: {session['title']}")
-            if extract_images:
-                print(f"    Images: {total_images}")
-        except Exception as e:
-            print(f"  ✗ Error processing {pdf_file.name}: {e}")
+            for future in completed:
+                pdf_file = futures[future]
+                try:
+                    session = future.result()
+                    results[pdf_file] = session
+                    
+                    if tqdm is not None:
+                        completed.set_postfix_str(f"session {session['id']}")
+                        continue
+                    total_images = sum(len(drill.get('images', [])) for drill in session['drills'])
+                    print(f"  ✓ Extracted session {session['id']}: {session['title']}")
+                    if extract_images:
+                        print(f"    Images: {total_images}")
+                except Exception as e:
+                    errors.append(f"  ✗ Error processing {pdf_file.name}: {e}")
+            
+            # Errors are reported after the progress bar is done
+            for error in errors:
+                print(error)
+    
+    # Keep file order independent of completion order
+    new_sessions = [results[pdf_file] for pdf_file in work_items if pdf_file in results]
+    
+    # Nothing to add: skip re-serializing an unchanged library in place
+    output_path = output_path or library_path
+    if not new_sessions and output_path == library_path:
+        print("\nNo new sessions, library unchanged")
+        return
     
     # Add new sessions to library
     library['sessions'].extend(new_sessions)
@@ -438,9 +510,7 @@ def update_library(library_path: str, pdf_dir: str, output_path: str = None, ext
     library['sessions'].sort(key=lambda x: x['id'])
     
     # Save updated library
-    output_path = output_path or library_path
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(library, f, ensure_ascii=False, indent=2)
+    save_json(output_path, library)
     
     total_images = sum(
         sum(len(drill.get('images', [])) for drill in session['drills'])
@@ -472,8 +542,7 @@ def extract_single_pdf(pdf_path: str, output_json: str = None, extract_images: b
         print(f"  Images extracted: {total_images}")
     
     if output_json:
-        with open(output_json, 'w', encoding='utf-8') as f:
-            json.dump(session, f, ensure_ascii=False, indent=2)
+        save_json(output_json, session)
         print(f"  Saved to {output_json}")
     
     return session
@@ -5,12 +5,40 @@ This creates complete drill diagrams
 """
 
 import fitz
-import json
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from pathlib import Path
 import re
 
+from json_utils import load_json, save_json
 
-def extract_page_as_image(pdf_path: str, page_num: int, output_path: str, dpi: int = 150):
+# Session ID from file names like "trainingseinheit 184.pdf"
+_SESSION_ID_RE = re.compile(r'(\d+)')
+
+# Output formats for page images (file extension = format name)
+IMAGE_FORMATS = ('png', 'jpg', 'webp')
+JPEG_QUALITY = 85
+WEBP_QUALITY = 80
+
+# Page write threads per PDF; update runs one PDF per CPU in worker processes
+PAGE_WRITE_WORKERS = 2
+
+
+def encode_pixmap(pix, image_format: str = 'png') -> bytes:
+    """Encode a rendered page in the given image format"""
+    if image_format == 'png':
+        return pix.tobytes("png")
+    if image_format == 'jpg':
+        return pix.tobytes("jpeg", jpg_quality=JPEG_QUALITY)
+    if image_format == 'webp':
+        # MuPDF has no WebP encoder; this goes through Pillow
+        return pix.pil_tobytes(format="WEBP", quality=WEBP_QUALITY)
+    raise ValueError(f"Unknown image format: {image_format}")
+
+
+def extract_page_as_image(pdf_path: str, page_num: int, output_path: str, dpi: int = 150,
+                          image_format: str = 'png'):
     """Extract a full page as an image"""
     doc = fitz.open(pdf_path)
     page = doc[page_num - 1]  # 0-based index
@@ -20,14 +48,15 @@ def extract_page_as_image(pdf_path: str, page_num: int, output_path: str, dpi: i
     mat = fitz.Matrix(zoom, zoom)
     pix = page.get_pixmap(matrix=mat)
     
-    # Save as PNG
-    pix.save(output_path)
+    # Save image
+    Path(output_path).write_bytes(encode_pixmap(pix, image_format))
     doc.close()
     
     return output_path
 
 
-def extract_all_pages_from_pdf(pdf_path: str, output_dir: str, session_id: int, dpi: int = 150):
+def extract_all_pages_from_pdf(pdf_path: str, output_dir: str, session_id: int, dpi: int = 150,
+                               image_format: str = 'png'):
     """Extract all pages from a PDF as images"""
     doc = fitz.open(pdf_path)
     output_path = Path(output_dir)
@@ -35,82 +64,116 @@ def extract_all_pages_from_pdf(pdf_path: str, output_dir: str, session_id: int,
     
     images = []
     
-    for page_num in range(len(doc)):
-        page_number = page_num + 1
-        image_filename = f"TE_{session_id:03d}_page_{page_number}.png"
-        image_path = output_path / image_filename
-        
-        # Render page
-        page = doc[page_num]
-        zoom = dpi / 72
-        mat = fitz.Matrix(zoom, zoom)
-        pix = page.get_pixmap(matrix=mat)
-        pix.save(str(image_path))
-        
-        relative_path = f"drill_images/TE_{session_id:03d}/{image_filename}"
+    # Same render matrix for every page
+    zoom = dpi / 72  # 72 is default DPI
+    mat = fitz.Matrix(zoom, zoom)
+    
+    # PyMuPDF is not thread-safe, so pages are rendered and encoded here;
+    # only the file writes go to a thread pool to overlap disk I/O
+    with ThreadPoolExecutor(max_workers=PAGE_WRITE_WORKERS) as writer:
+        writes = []
         
-        images.append({
-            "path": relative_path,
-            "page": page_number,
-            "order": 1,
-            "type": "full_page"
-        })
+        for page_num in range(len(doc)):
+            page_number = page_num + 1
+            image_filename = f"TE_{session_id:03d}_page_{page_number}.{image_format}"
+            image_path = output_path / image_filename
+            
+            # Render page
+            page = doc[page_num]
+            pix = page.get_pixmap(matrix=mat)
+            writes.append(writer.submit(image_path.write_bytes, encode_pixmap(pix, image_format)))
+            
+            relative_path = f"drill_images/TE_{session_id:03d}/{image_filename}"
+            
+            images.append({
+                "path": relative_path,
+                "page": page_number,
+                "order": 1,
+                "type": "full_page"
+            })
+            
+            print(f"  TE_{session_id:03d}: extracted page {page_number}")
         
-        print(f"  Extracted page {page_number}")
+        # Surface write errors
+        for write in writes:
+            write.result()
     
     doc.close()
     return images
 
 
-def update_library_with_page_images(library_path: str, pdf_dir: str, output_path: str, dpi: int = 150):
+def update_library_with_page_images(library_path: str, pdf_dir: str, output_path: str, dpi: int = 150,
+                                    image_format: str = 'png'):
     """Update library with full page images"""
     
-    with open(library_path, 'r', encoding='utf-8') as f:
-        library = json.load(f)
+    library = load_json(library_path)
+    
+    # Index sessions by ID for constant-time lookups
+    by_id = {s['id']: s for s in library['sessions']}
     
     pdf_files = sorted(Path(pdf_dir).glob('*.pdf'))
     
     print(f"Processing {len(pdf_files)} PDFs...")
     print(f"DPI: {dpi}")
+    print(f"Format: {image_format}")
+    
+    work_items = []
     
     for pdf_file in pdf_files:
-        match = re.search(r'(\d+)', pdf_file.name)
+        match = _SESSION_ID_RE.search(pdf_file.name)
         if not match:
             continue
         
         session_id = int(match.group(1))
         
         # Find session in library
-        session = next((s for s in library['sessions'] if s['id'] == session_id), None)
+        session = by_id.get(session_id)
         if not session:
             print(f"Skipping {pdf_file.name} (not in library)")
             continue
         
-        print(f"Processing {pdf_file.name}...")
-        
-        # Extract all pages as images
-        output_dir = f"drill_images/TE_{session_id:03d}"
-        images = extract_all_pages_from_pdf(str(pdf_file), output_dir, session_id, dpi)
-        
-        # Assign images to drills based on page numbers
-        for drill in session['drills']:
-            drill_page = drill.get('source_page_start', 2)
-            drill['images'] = [img for img in images if img['page'] == drill_page]
-        
-        print(f"  ✓ Extracted {len(images)} page images")
+        work_items.append((pdf_file, session_id, session))
+    
+    if not work_items:
+        print("No PDFs to process")
+    else:
+        # Page rendering is CPU-bound and independent per PDF
+        max_workers = min(len(work_items), os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {}
+            for pdf_file, session_id, session in work_items:
+                # Extract all pages as images
+                output_dir = f"drill_images/TE_{session_id:03d}"
+                future = executor.submit(extract_all_pages_from_pdf, str(pdf_file), output_dir, session_id, dpi,
+                                         image_format)
+                futures[future] = (pdf_file, session)
+            
+            for future in as_completed(futures):
+                pdf_file, session = futures[future]
+                images = future.result()
+                
+                images_by_page = defaultdict(list)
+                for img in images:
+                    images_by_page[img['page']].append(img)
+                
+                # Assign images to drills based on page numbers
+                for drill in session['drills']:
+                    drill['images'] = list(images_by_page.get(drill.get('source_page_start', 2), ()))
+                
+                print(f"  ✓ {pdf_file.name}: extracted {len(images)} page images")
     
     # Save updated library
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(library, f, ensure_ascii=False, indent=2)
+    save_json(output_path, library)
     
     print(f"\n✓ Saved to {output_path}")
 
 
-def extract_single_session(pdf_path: str, session_id: int = None, dpi: int = 150):
+def extract_single_session(pdf_path: str, session_id: int = None, dpi: int = 150,
+                           image_format: str = 'png'):
     """Extract pages from a single PDF"""
     
     if session_id is None:
-        match = re.search(r'(\d+)', Path(pdf_path).name)
+        match = _SESSION_ID_RE.search(Path(pdf_path).name)
         session_id = int(match.group(1)) if match else 999
     
     output_dir = f"drill_images/TE_{session_id:03d}"
@@ -118,8 +181,9 @@ def extract_single_session(pdf_path: str, session_id: int = None, dpi: int = 150
     print(f"Extracting pages from {pdf_path}...")
     print(f"Output: {output_dir}")
     print(f"DPI: {dpi}")
+    print(f"Format: {image_format}")
     
-    images = extract_all_pages_from_pdf(pdf_path, output_dir, session_id, dpi)
+    images = extract_all_pages_from_pdf(pdf_path, output_dir, session_id, dpi, image_format)
     
     print(f"\n✓ Extracted {len(images)} pages")
     for img in images:
@@ -131,26 +195,34 @@ def extract_single_session(pdf_path: str, session_id: int = None, dpi: int = 150
 if __name__ == "__main__":
     import sys
     
-    if len(sys.argv) < 2:
+    args = sys.argv[1:]
+    image_format = 'png'
+    if '--format' in args:
+        index = args.index('--format')
+        image_format = args[index + 1] if index + 1 < len(args) else ''
+        del args[index:index + 2]
+    
+    if len(args) < 1 or image_format not in IMAGE_FORMATS:
         print("Usage:")
-        print("  python pdf_to_images.py single <pdf_file> [dpi]")
-        print("  python pdf_to_images.py update <library.json> <pdf_dir> <output.json> [dpi]")
+        print("  python pdf_to_images.py single <pdf_file> [dpi] [--format png|jpg|webp]")
+        print("  python pdf_to_images.py update <library.json> <pdf_dir> <output.json> [dpi] [--format png|jpg|webp]")
         print("\nDefault DPI: 150 (higher = better quality but larger files)")
+        print("Default format: png (jpg/webp are much smaller; webp requires Pillow)")
         sys.exit(1)
     
-    command = sys.argv[1]
+    command = args[0]
     
     if command == "single":
-        pdf_file = sys.argv[2]
-        dpi = int(sys.argv[3]) if len(sys.argv) > 3 else 150
-        extract_single_session(pdf_file, dpi=dpi)
+        pdf_file = args[1]
+        dpi = int(args[2]) if len(args) > 2 else 150
+        extract_single_session(pdf_file, dpi=dpi, image_format=image_format)
     
     elif command == "update":
-        library_file = sys.argv[2]
-        pdf_dir = sys.argv[3]
-        output = sys.argv[4]
-        dpi = int(sys.argv[5]) if len(sys.argv) > 5 else 150
-        update_library_with_page_images(library_file, pdf_dir, output, dpi)
+        library_file = args[1]
+        pdf_dir = args[2]
+        output = args[3]
+        dpi = int(args[4]) if len(args) > 4 else 150
+        update_library_with_page_images(library_file, pdf_dir, output, dpi, image_format)
     
     else:
         print(f"Unknown command: {command}")
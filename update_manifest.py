@@ -3,9 +3,10 @@
 Update manifest.json with new library version.
 """
 
-import json
 from datetime import datetime
 
+from json_utils import load_json, save_json
+
 def update_manifest(manifest_path, library_version, library_url, stats):
     """
     Update manifest.json with new version info.
@@ -20,8 +21,7 @@ def update_manifest(manifest_path, library_version, library_url, stats):
     
     # Load existing manifest
     try:
-        with open(manifest_path, 'r', encoding='utf-8') as f:
-            manifest = json.load(f)
+        manifest = load_json(manifest_path)
     except FileNotFoundError:
         manifest = {
             "library_id": "handball-training-library",
@@ -46,8 +46,7 @@ def update_manifest(manifest_path, library_version, library_url, stats):
         manifest["changelog"].insert(0, changelog_entry)
     
     # Save manifest
-    with open(manifest_path, 'w', encoding='utf-8') as f:
-        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    save_json(manifest_path, manifest)
     
     print(f"✓ Manifest updated to version {library_version}")
     print(f"  URL: {library_url}")